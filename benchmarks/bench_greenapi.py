@@ -0,0 +1,93 @@
+"""Benchmark GreenAPIClient throughput and tail latency against the fake server.
+
+Sends --messages messages through one client, either from a thread pool (sync) or
+as asyncio tasks, and reports messages per second with the client's own latency
+histogram and status counts. No network access is needed.
+
+    python benchmarks/bench_greenapi.py --messages 2000 --concurrency 32 --latency 0.02
+    python benchmarks/bench_greenapi.py --mode async --jitter 0.2 --error-rate 0.01
+
+Exits with status 1 if --min-throughput or --max-p99 is not met.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from requests.exceptions import RequestException
+from greenapi import GreenAPIClient
+from fake_greenapi import start_server
+
+def send_one(client, n):
+    try:
+        client.send_message('bench@g.us', f"Benchmark message {n}")
+    except RequestException:
+        pass # Counted in the client's status stats
+
+def run_sync(client, messages, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda n: send_one(client, n), range(messages)))
+
+async def run_async(client, messages, concurrency):
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def send(n):
+        async with limit:
+            try:
+                await client.send_message_async('bench@g.us', f"Benchmark message {n}", executor=executor)
+            except RequestException:
+                pass
+
+    await asyncio.gather(*(send(n) for n in range(messages)))
+    executor.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GreenAPI client.")
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--mode', choices=['sync', 'async'], default='sync')
+    parser.add_argument('--latency', type=float, default=0.0, help="Fake server response delay in seconds.")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Extra random delay of up to this many seconds.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of sends that get an HTTP 500.")
+    parser.add_argument('--min-throughput', type=float, help="Fail below this many messages per second.")
+    parser.add_argument('--max-p99', type=float, help="Fail if p99 latency exceeds this many milliseconds.")
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    client = GreenAPIClient(server.url, 'bench', 'bench-token', pool_size=args.concurrency)
+
+    start = time.perf_counter()
+    if args.mode == 'sync':
+        run_sync(client, args.messages, args.concurrency)
+    else:
+        asyncio.run(run_async(client, args.messages, args.concurrency))
+    elapsed = time.perf_counter() - start
+
+    client.close()
+    server.shutdown()
+
+    stats = client.stats()['sendMessage']
+    throughput = args.messages / elapsed
+    print(f"{args.messages} messages in {elapsed:.2f}s ({args.mode}, concurrency {args.concurrency}): "
+          f"{throughput:.0f} msg/s")
+    print(f"latency ms: mean {stats['mean_ms']}, p50 <= {stats['p50_ms']}, p99 <= {stats['p99_ms']}, "
+          f"max {stats['max_ms']}")
+    print(f"responses: {stats['statuses']}")
+
+    failures = []
+    if args.min_throughput is not None and throughput < args.min_throughput:
+        failures.append(f"throughput {throughput:.0f} msg/s is below {args.min_throughput:.0f}")
+    if args.max_p99 is not None and stats['p99_ms'] > args.max_p99:
+        failures.append(f"p99 {stats['p99_ms']} ms exceeds {args.max_p99} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Benchmark the reminder cron job phase by phase.
+
+Each run starts run_reminders_fixed.py in a fresh interpreter, as a Render cron
+container would, against a seeded database of --households households and the fake GreenAPI server. The JSON
+timing spans it writes to stderr are collected and summarised as p50/p99 per phase.
+
+    python benchmarks/bench_reminders.py --runs 30
+    python benchmarks/bench_reminders.py --households 1000 --runs 5
+    python benchmarks/bench_reminders.py --database-url postgresql://localhost/bin_bench --max-p99 job=250
+
+For --reminder-type bring-in, each run starts from today's confirmed assignment, as
+the previous night's take-out run would leave it.
+
+The database's households, residents, assignments and outbox are wiped, so point it at a
+scratch database. Exits with status 1 if any --max-p99 limit is exceeded.
+"""
+import os
+import sys
+import json
+import math
+import argparse
+import tempfile
+import subprocess
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from datetime import timedelta
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from core import (AppState, Assignment, BinRule, Household, OutboxMessage, Resident, ScheduleException,
+                  create_db_engine, init_db, local_today, utcnow)
+from fake_greenapi import start_server
+
+PHASES = ['import', 'db_connect', 'due_scan', 'due_check', 'roster_load', 'rotation_update', 'message_render',
+          'enqueue_commit', 'http_send', 'job', 'wall']
+
+def seed(engine, num_households, num_residents):
+    init_db(engine)
+    with Session(engine) as db_session:
+        for model in (OutboxMessage, Assignment, AppState, Resident, BinRule, ScheduleException, Household):
+            db_session.query(model).delete()
+        today = local_today()
+        for number in range(1, num_households + 1):
+            household = Household(name=f"Household {number}", chat_id=f"bench-{number}@g.us")
+            db_session.add(household)
+            db_session.flush()
+            # Resident 1 took the bins out last night, as the bring-in reminder expects
+            db_session.add(AppState(household_id=household.id, version=0, last_position=1,
+                                    next_collection_date=today))
+            db_session.add_all([Resident(household_id=household.id, name=f"Resident {n}", position=n)
+                                for n in range(1, num_residents + 1)])
+            # Collections today and tomorrow, so both reminder types have work whatever day it is
+            db_session.add_all([BinRule(household_id=household.id, bin_type=f"Bin {n}", bin_color="grey",
+                                        anchor_date=today + timedelta(days=n), interval_weeks=1,
+                                        next_occurrence=today + timedelta(days=n)) for n in (0, 1)])
+        db_session.commit()
+
+def reset_between_runs(engine, reminder_type):
+    # Without this the next run would find today's reminder already queued
+    with Session(engine) as db_session:
+        db_session.query(OutboxMessage).delete()
+        db_session.query(Assignment).delete()
+        if reminder_type == 'bring-in':
+            # Today's duty as last night's take-out run confirmed it, so bring-in has someone to remind
+            db_session.execute(insert(Assignment), [
+                {"household_id": household_id, "collection_date": local_today(), "bin_type": "Bin 0",
+                 "bin_color": "grey", "resident_id": resident_id, "resident_name": "Resident 1",
+                 "confirmed_at": utcnow()}
+                for household_id, resident_id in db_session.query(Resident.household_id, Resident.id)
+                                                           .filter(Resident.position == 1)])
+        db_session.commit()
+
+def run_once(env, reminder_type):
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, os.path.join(ROOT, 'run_reminders_fixed.py'), reminder_type],
+                             env=env, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if process.returncode:
+        raise RuntimeError(f"Reminder job failed:\n{process.stderr}")
+
+    timings = {'wall': wall_ms}
+    for line in process.stderr.splitlines():
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(event, dict) and event.get('event') == 'span':
+            # A phase can occur more than once per run; report its total
+            timings[event['span']] = timings.get(event['span'], 0.0) + event['duration_ms']
+    return timings
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+def parse_limits(limits):
+    parsed = {}
+    for limit in limits:
+        phase, _, value = limit.partition('=')
+        parsed[phase] = float(value)
+    return parsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reminder cron job.")
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2, help="Runs discarded before measuring.")
+    parser.add_argument('--households', type=int, default=1)
+    parser.add_argument('--residents', type=int, default=10, help="Residents per household.")
+    parser.add_argument('--reminder-type', choices=['take-out', 'bring-in'], default='take-out')
+    parser.add_argument('--database-url', help="Defaults to a temporary SQLite file.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Fake GreenAPI response delay in seconds.")
+    parser.add_argument('--max-p99', action='append', default=[], metavar='PHASE=MS',
+                        help="Fail if a phase's p99 exceeds this many milliseconds. Repeatable.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        database_url = args.database_url or f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+        engine = create_db_engine(database_url)
+        seed(engine, args.households, args.residents)
+        server = start_server(latency=args.latency)
+
+        env = dict(os.environ,
+                   DATABASE_URL=database_url,
+                   GREENAPI_API_URL=server.url,
+                   GREENAPI_INSTANCE_ID='bench',
+                   GREENAPI_API_TOKEN='bench-token',
+                   WHATSAPP_GROUP_CHAT_ID='bench@g.us',
+                   GREENAPI_MAX_PER_SECOND='0',
+                   REMINDER_TIMING_LOG='1')
+
+        samples = {}
+        for run in range(args.warmup + args.runs):
+            reset_between_runs(engine, args.reminder_type)
+            timings = run_once(env, args.reminder_type)
+            if run >= args.warmup:
+                for phase, duration in timings.items():
+                    samples.setdefault(phase, []).append(duration)
+
+        server.shutdown()
+        engine.dispose()
+
+    print(f"{'phase':<16}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for phase in PHASES:
+        if phase in samples:
+            values = samples[phase]
+            print(f"{phase:<16}{percentile(values, 50):>10.2f}{percentile(values, 99):>10.2f}{max(values):>10.2f}")
+
+    failures = []
+    for phase, limit in parse_limits(args.max_p99).items():
+        if phase in samples and percentile(samples[phase], 99) > limit:
+            failures.append(f"{phase} p99 {percentile(samples[phase], 99):.2f} ms > {limit:.2f} ms")
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
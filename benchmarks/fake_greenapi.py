@@ -0,0 +1,76 @@
+"""A local stand-in for the GreenAPI sendMessage endpoint, for benchmarks.
+
+Run it directly (python benchmarks/fake_greenapi.py --port 8099) or start it in a
+thread with start_server(). Latency, jitter and an error rate can be injected to
+see how the client's throughput and tail latency respond.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeGreenAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, like the real API
+    # Headers and body go out in separate writes; without this, delayed ACKs stall keep-alive clients
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        delay = self.server.latency + random.uniform(0, self.server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if random.random() < self.server.error_rate:
+            self.respond(500, {"message": "Injected failure"})
+            return
+
+        with self.server.lock:
+            self.server.received.append({"path": self.path, "payload": json.loads(body or b'{}')})
+            message_id = len(self.server.received)
+
+        self.respond(200, {"idMessage": f"FAKE{message_id:08d}"})
+
+    def respond(self, status, payload):
+        response = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(port=0, latency=0.0, jitter=0.0, error_rate=0.0):
+    """Serve in a background thread; returns the server (its URL is server.url).
+
+    Each response waits latency plus up to jitter seconds, and error_rate of them
+    are HTTP 500s.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeGreenAPIHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.lock = threading.Lock()
+    server.received = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a fake GreenAPI server.")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds to wait before each response.")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many extra seconds per response.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with a 500.")
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Fake GreenAPI listening on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
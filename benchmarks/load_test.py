@@ -0,0 +1,254 @@
+"""Load-test the web routes through gunicorn against a seeded database.
+
+Seeds --households households of --residents residents each, with the default bin
+schedule and materialized assignments, then starts gunicorn and requests `/`,
+`/setup`, `/schedule?weeks=N` and `/test-reminders` for random households from
+--concurrency client threads. Reports throughput, latency percentiles and the
+database queries each route took (from the X-DB-Queries header).
+
+    python benchmarks/load_test.py --households 1000 --residents 10 --requests 500
+    python benchmarks/load_test.py --write-baseline benchmarks/load_baseline.json
+    python benchmarks/load_test.py --baseline benchmarks/load_baseline.json --p99-tolerance 0.5
+
+The app's tables are dropped and recreated, so point --database-url at a scratch
+database. Exits with status 1 if any request failed, a route made more queries
+than in the baseline, or a route's p99 exceeds the baseline by more than
+--p99-tolerance or a --max-p99 limit.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from core import (DEFAULT_RULES, AppState, Base, BinRule, Household, Resident, create_db_engine, local_today,
+                  refresh_assignments, rule_next_occurrence)
+from bench_reminders import parse_limits, percentile
+
+ROUTES = {
+    'home': '/',
+    'setup': '/setup',
+    'schedule': '/schedule?weeks={weeks}',
+    'test_reminders': '/test-reminders?day=thursday',
+}
+
+SEED_CHUNK = 500 # Households inserted per round trip
+
+# --- Fixture ---
+def seed(engine, num_households, num_residents, materialize=True):
+    """Recreate the tables and fill them, returning the household ids."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    today = local_today()
+    rules = [(rule, rule_next_occurrence(rule, {}, today)) for rule in DEFAULT_RULES]
+    next_collection_date = min(next_occurrence for _, next_occurrence in rules)
+
+    household_ids = []
+    with Session(engine) as db_session:
+        for start in range(0, num_households, SEED_CHUNK):
+            numbers = range(start + 1, min(start + SEED_CHUNK, num_households) + 1)
+            chunk = db_session.scalars(insert(Household).returning(Household.id, sort_by_parameter_order=True),
+                                       [{"name": f"Household {n}", "chat_id": f"load-{n}@g.us"} for n in numbers]).all()
+            db_session.execute(insert(AppState), [{"household_id": household_id, "version": 0,
+                                                   "next_collection_date": next_collection_date}
+                                                  for household_id in chunk])
+            db_session.execute(insert(Resident), [{"household_id": household_id, "name": f"Resident {n}", "position": n}
+                                                  for household_id in chunk for n in range(1, num_residents + 1)])
+            db_session.execute(insert(BinRule), [{"household_id": household_id, "next_occurrence": next_occurrence,
+                                                  **rule._asdict()}
+                                                 for household_id in chunk for rule, next_occurrence in rules])
+            if materialize:
+                # As the web app would after a while; otherwise first visits write the horizon
+                for household_id in chunk:
+                    refresh_assignments(db_session, household_id)
+            db_session.commit()
+            household_ids.extend(chunk)
+    return household_ids
+
+# --- Server ---
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_gunicorn(database_url, workers, threads, log_file, timeout=60):
+    port = free_port()
+    env = dict(os.environ,
+               DATABASE_URL=database_url,
+               PORT=str(port),
+               WEB_CONCURRENCY=str(workers),
+               DB_POOL_SIZE=str(threads),
+               DB_QUERY_HEADER='1')
+    # gunicorn.conf.py in the repository root is picked up as in production
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--threads', str(threads), 'app:app'],
+                               cwd=ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}; see {log_file.name}")
+        try:
+            requests.get(f"{base_url}/api/households?limit=1", timeout=1)
+            return process, base_url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"gunicorn didn't start within {timeout}s; see {log_file.name}")
+
+# --- Load ---
+def make_requests(household_ids, weeks, per_route, rng):
+    jobs = [(route, f"/households/{rng.choice(household_ids)}{path.format(weeks=weeks)}")
+            for route, path in ROUTES.items() for _ in range(per_route)]
+    rng.shuffle(jobs)
+    return jobs
+
+def drive(base_url, jobs, concurrency):
+    """Send every (route, path) request from a thread pool, returning results and elapsed seconds."""
+    local = threading.local()
+
+    def fetch(job):
+        route, path = job
+        if not hasattr(local, 'session'):
+            local.session = requests.Session() # One keep-alive connection per client thread
+        start = time.perf_counter()
+        try:
+            response = local.session.get(base_url + path, timeout=30)
+        except requests.exceptions.RequestException as e:
+            return route, (time.perf_counter() - start) * 1000, type(e).__name__, None
+        queries = response.headers.get('X-DB-Queries')
+        return route, (time.perf_counter() - start) * 1000, response.status_code, queries and int(queries)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(fetch, jobs))
+    return results, time.perf_counter() - start
+
+def summarise(results, elapsed):
+    routes = {}
+    for route, duration_ms, status, queries in results:
+        stats = routes.setdefault(route, {"latencies": [], "queries": [], "errors": 0})
+        stats["latencies"].append(duration_ms)
+        if queries is not None:
+            stats["queries"].append(queries)
+        if status != 200:
+            stats["errors"] += 1
+
+    summary = {}
+    for route in ROUTES:
+        stats = routes.get(route)
+        if not stats:
+            continue
+        latencies, queries = stats["latencies"], stats["queries"]
+        summary[route] = {"requests": len(latencies),
+                          "throughput": round(len(latencies) / elapsed, 1),
+                          "p50_ms": round(percentile(latencies, 50), 2),
+                          "p90_ms": round(percentile(latencies, 90), 2),
+                          "p99_ms": round(percentile(latencies, 99), 2),
+                          "max_ms": round(max(latencies), 2),
+                          "mean_queries": round(sum(queries) / len(queries), 2) if queries else None,
+                          "max_queries": max(queries) if queries else None,
+                          "errors": stats["errors"]}
+    return summary
+
+def compare(summary, baseline, p99_tolerance, limits):
+    failures = []
+    for route, stats in summary.items():
+        if stats["errors"]:
+            failures.append(f"{route}: {stats['errors']} request(s) failed")
+        if route in limits and stats["p99_ms"] > limits[route]:
+            failures.append(f"{route} p99 {stats['p99_ms']:.2f} ms > {limits[route]:.2f} ms")
+        expected = baseline.get("routes", {}).get(route)
+        if not expected:
+            continue
+        if stats["max_queries"] is not None and stats["max_queries"] > expected["max_queries"]:
+            failures.append(f"{route} took up to {stats['max_queries']} queries, baseline {expected['max_queries']}")
+        allowed = expected["p99_ms"] * (1 + p99_tolerance)
+        if stats["p99_ms"] > allowed:
+            failures.append(f"{route} p99 {stats['p99_ms']:.2f} ms > {allowed:.2f} ms "
+                            f"(baseline {expected['p99_ms']:.2f} ms + {p99_tolerance:.0%})")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the web routes through gunicorn.")
+    parser.add_argument('--households', type=int, default=200)
+    parser.add_argument('--residents', type=int, default=10, help="Residents per household.")
+    parser.add_argument('--weeks', type=int, default=8, help="Weeks requested from /schedule.")
+    parser.add_argument('--requests', type=int, default=200, help="Measured requests per route.")
+    parser.add_argument('--warmup', type=int, default=20, help="Requests per route discarded before measuring.")
+    parser.add_argument('--concurrency', type=int, default=16, help="Client threads.")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes.")
+    parser.add_argument('--threads', type=int, default=4, help="Threads per gunicorn worker.")
+    parser.add_argument('--database-url', help="Defaults to a temporary SQLite file.")
+    parser.add_argument('--no-materialize', action='store_true',
+                        help="Leave the assignment table empty, so first visits materialize it.")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed for the household picked per request.")
+    parser.add_argument('--baseline', help="JSON file from --write-baseline to compare against.")
+    parser.add_argument('--write-baseline', metavar='PATH', help="Save this run's results as a baseline.")
+    parser.add_argument('--p99-tolerance', type=float, default=0.5,
+                        help="Allowed p99 increase over the baseline, as a fraction.")
+    parser.add_argument('--max-p99', action='append', default=[], metavar='ROUTE=MS',
+                        help="Fail if a route's p99 exceeds this many milliseconds. Repeatable.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        database_url = args.database_url or f"sqlite:///{os.path.join(scratch, 'load.db')}"
+        engine = create_db_engine(database_url)
+        start = time.perf_counter()
+        household_ids = seed(engine, args.households, args.residents, materialize=not args.no_materialize)
+        engine.dispose()
+        print(f"Seeded {args.households} household(s) of {args.residents} resident(s) "
+              f"in {time.perf_counter() - start:.1f}s.")
+
+        with open(os.path.join(scratch, 'gunicorn.log'), 'w') as log_file:
+            server, base_url = start_gunicorn(database_url, args.workers, args.threads, log_file)
+            try:
+                rng = random.Random(args.seed)
+                drive(base_url, make_requests(household_ids, args.weeks, args.warmup, rng), args.concurrency)
+                results, elapsed = drive(base_url, make_requests(household_ids, args.weeks, args.requests, rng),
+                                         args.concurrency)
+            finally:
+                server.terminate()
+                server.wait()
+
+    summary = summarise(results, elapsed)
+    print(f"{len(results)} requests in {elapsed:.2f}s: {len(results) / elapsed:.0f} req/s "
+          f"({args.workers} worker(s) x {args.threads} thread(s), {args.concurrency} client(s))")
+    print(f"{'route':<16}{'req/s':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+          f"{'queries':>9}{'max q':>7}{'errors':>8}")
+    for route, stats in summary.items():
+        print(f"{route:<16}{stats['throughput']:>8.1f}{stats['p50_ms']:>10.2f}{stats['p90_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}{stats['mean_queries'] or 0:>9.2f}"
+              f"{stats['max_queries'] or 0:>7}{stats['errors']:>8}")
+
+    fixture = {"households": args.households, "residents": args.residents, "weeks": args.weeks}
+    if args.write_baseline:
+        with open(args.write_baseline, 'w') as f:
+            json.dump({"fixture": fixture, "routes": summary}, f, indent=2)
+        print(f"Baseline written to {args.write_baseline}.")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("fixture") != fixture:
+            print(f"Warning: the baseline was recorded with {baseline.get('fixture')}, not {fixture}.")
+
+    failures = compare(summary, baseline, args.p99_tolerance, parse_limits(args.max_p99))
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
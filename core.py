@@ -0,0 +1,736 @@
+"""Models, bin schedule and rotation logic shared by the web app and the cron job.
+
+Only SQLAlchemy and pytz are imported here, so the cron job can use this module
+without building a Flask app.
+"""
+import os
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache, reduce
+from math import lcm
+from pytz import timezone, utc
+from sqlalchemy import (Column, Date, DateTime, ForeignKey, Index, Integer, String, Text,
+                        create_engine, func, insert, inspect, or_, select, text, update)
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.pool import NullPool
+
+ASSIGNMENT_HORIZON_WEEKS = int(os.getenv('ASSIGNMENT_HORIZON_WEEKS', '52'))
+APP_TIMEZONE = os.getenv('APP_TIMEZONE', 'Europe/London') # Whose "today" the schedule follows
+
+# Connection pool per process; DB_POOL_SIZE=0 opens a fresh connection each time (NullPool)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '2'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '2'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+# Recycle connections before Render's idle timeout closes them under us
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '280'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1').lower() not in ('0', 'false', 'no')
+# Set when DATABASE_URL points at PgBouncer (or another pooler) in transaction mode
+DB_TRANSACTION_POOLER = os.getenv('DB_TRANSACTION_POOLER', '0').lower() not in ('0', 'false', 'no')
+
+# --- Database Models ---
+class Base(DeclarativeBase):
+    pass
+
+class Household(Base):
+    __tablename__ = 'household'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(120), nullable=False)
+    chat_id = Column(String(100)) # WhatsApp group the reminders go to
+    timezone = Column(String(64)) # None follows APP_TIMEZONE
+    created_at = Column(DateTime)
+
+class Resident(Base):
+    __tablename__ = 'resident'
+    id = Column(Integer, primary_key=True)
+    household_id = Column(Integer, ForeignKey('household.id', ondelete='CASCADE'), nullable=False)
+    name = Column(String(80), nullable=False)
+    # Rotation order within the household; gaps left by removed residents are fine
+    position = Column(Integer)
+
+    __table_args__ = (Index('ix_resident_household_position', 'household_id', 'position', unique=True),
+                      Index('ix_resident_household_name', 'household_id', 'name', unique=True))
+
+class AppState(Base):
+    __tablename__ = 'app_state'
+    id = Column(Integer, primary_key=True)
+    household_id = Column(Integer, ForeignKey('household.id', ondelete='CASCADE'), nullable=False)
+    last_person_index = Column(Integer, default=-1) # Superseded by last_position
+    last_position = Column(Integer) # Position of the last resident on duty
+    # Bumped on every roster or rotation change; the web app derives its ETags from it
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+    updated_at = Column(DateTime)
+    # Earliest upcoming collection; the cron job only works on rows due in its window
+    next_collection_date = Column(Date)
+
+    __table_args__ = (Index('ix_app_state_household', 'household_id', unique=True),
+                      Index('ix_app_state_due', 'next_collection_date', 'id'))
+
+class Assignment(Base):
+    __tablename__ = 'assignment'
+    id = Column(Integer, primary_key=True)
+    household_id = Column(Integer, ForeignKey('household.id', ondelete='CASCADE'), nullable=False)
+    collection_date = Column(Date, nullable=False)
+    bin_type = Column(String(80), nullable=False)
+    bin_color = Column(String(80), nullable=False)
+    resident_id = Column(Integer, ForeignKey('resident.id', ondelete='SET NULL'))
+    # Name is copied so the audit trail survives the resident being removed
+    resident_name = Column(String(80), nullable=False)
+    confirmed_at = Column(DateTime) # Set by the cron job once the duty is actually assigned
+
+    __table_args__ = (Index('ix_assignment_household_date', 'household_id', 'collection_date', unique=True),)
+
+class BinRule(Base):
+    __tablename__ = 'bin_rule'
+    id = Column(Integer, primary_key=True)
+    household_id = Column(Integer, ForeignKey('household.id', ondelete='CASCADE'), nullable=False)
+    bin_type = Column(String(80), nullable=False)
+    bin_color = Column(String(80), nullable=False)
+    anchor_date = Column(Date, nullable=False) # Any one collection day of this bin
+    interval_weeks = Column(Integer, nullable=False, default=1)
+    # Kept current by the cron job, so "who collects tomorrow" is an index lookup
+    next_occurrence = Column(Date, index=True)
+
+    __table_args__ = (Index('ix_bin_rule_household_next', 'household_id', 'next_occurrence'),)
+
+class ScheduleException(Base):
+    __tablename__ = 'schedule_exception'
+    id = Column(Integer, primary_key=True)
+    household_id = Column(Integer, ForeignKey('household.id', ondelete='CASCADE'), nullable=False)
+    original_date = Column(Date, nullable=False)
+    moved_to = Column(Date) # None cancels that day's collection
+
+    __table_args__ = (Index('ix_schedule_exception_household_date', 'household_id', 'original_date', unique=True),)
+
+class OutboxMessage(Base):
+    __tablename__ = 'outbox_message'
+    id = Column(Integer, primary_key=True)
+    # One reminder per type, household and day; a retried cron run can't queue it twice
+    idempotency_key = Column(String(200), unique=True, nullable=False)
+    chat_id = Column(String(100), nullable=False)
+    message = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default='pending') # pending, sent or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(Text)
+    created_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime)
+
+    __table_args__ = (Index('ix_outbox_message_due', 'status', 'next_attempt_at'),)
+
+# --- Database Setup ---
+def engine_options(database_url, **overrides):
+    """Engine keyword arguments from the DB_* settings; overrides win.
+
+    Used for both create_engine and Flask-SQLAlchemy's SQLALCHEMY_ENGINE_OPTIONS.
+    """
+    url = make_url(database_url)
+    if url.get_backend_name() == 'sqlite':
+        return overrides # Local files; nothing goes stale and in-memory pools reject the sizing options
+
+    options = {'pool_pre_ping': DB_POOL_PRE_PING, 'pool_recycle': DB_POOL_RECYCLE, 'pool_timeout': DB_POOL_TIMEOUT,
+               'pool_size': DB_POOL_SIZE, 'max_overflow': DB_MAX_OVERFLOW, **overrides}
+    if DB_TRANSACTION_POOLER and url.get_driver_name() == 'psycopg':
+        # Each transaction may land on a different server connection, so statements
+        # prepared on one aren't there on the next. psycopg2 never prepares server-side.
+        options['connect_args'] = {**options.get('connect_args', {}), 'prepare_threshold': None}
+    if options['pool_size'] == 0:
+        for name in ('pool_size', 'max_overflow', 'pool_timeout'):
+            options.pop(name)
+        options['poolclass'] = NullPool
+    return options
+
+def create_db_engine(database_url, **options):
+    return create_engine(database_url, **engine_options(database_url, **options))
+
+def make_sessionmaker(engine):
+    return sessionmaker(bind=engine)
+
+# Columns added after the first release, as (table, column, DDL type)
+ADDED_COLUMNS = [
+    ('app_state', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+    ('app_state', 'updated_at', 'TIMESTAMP'),
+    ('app_state', 'next_collection_date', 'DATE'),
+]
+
+# Indexes on those columns, as (name, table, columns)
+ADDED_INDEXES = [
+    ('ix_app_state_due', 'app_state', 'next_collection_date, id'),
+]
+
+def upgrade_schema(engine):
+    """Add columns to databases created before they existed."""
+    inspector = inspect(engine)
+    resident_columns = {column['name'] for column in inspector.get_columns('resident')}
+    state_columns = {column['name'] for column in inspector.get_columns('app_state')}
+
+    if 'position' not in resident_columns:
+        with engine.begin() as connection:
+            connection.execute(text('ALTER TABLE resident ADD COLUMN position INTEGER'))
+            connection.execute(text('UPDATE resident SET position = id'))
+            connection.execute(text('CREATE UNIQUE INDEX ix_resident_position ON resident (position)'))
+
+    if 'last_position' not in state_columns:
+        with engine.begin() as connection:
+            connection.execute(text('ALTER TABLE app_state ADD COLUMN last_position INTEGER'))
+            # The old index counted into the roster ordered by id
+            positions = [row.position for row in connection.execute(text('SELECT position FROM resident ORDER BY id'))]
+            for state in connection.execute(text('SELECT id, last_person_index FROM app_state')).fetchall():
+                if state.last_person_index is not None and 0 <= state.last_person_index < len(positions):
+                    connection.execute(text('UPDATE app_state SET last_position = :position WHERE id = :id'),
+                                       {"position": positions[state.last_person_index], "id": state.id})
+
+    for table, column, ddl in ADDED_COLUMNS:
+        if column not in {existing['name'] for existing in inspector.get_columns(table)}:
+            with engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+    for name, table, columns in ADDED_INDEXES:
+        if name not in {index['name'] for index in inspect(engine).get_indexes(table)}:
+            with engine.begin() as connection:
+                connection.execute(text(f'CREATE INDEX {name} ON {table} ({columns})'))
+
+    if 'household_id' not in resident_columns:
+        scope_to_households(engine)
+
+# Tables whose rows belong to a household
+HOUSEHOLD_TABLES = ['resident', 'app_state', 'assignment', 'bin_rule', 'schedule_exception']
+
+DEFAULT_HOUSEHOLD_NAME = 'Home'
+
+def scope_to_households(engine):
+    """Move the rows of a database from before households into one default household."""
+    with engine.begin() as connection:
+        household_id = connection.execute(insert(Household).values(
+            name=DEFAULT_HOUSEHOLD_NAME, chat_id=os.getenv('WHATSAPP_GROUP_CHAT_ID'), created_at=utcnow()
+        )).inserted_primary_key[0]
+        added = []
+        for table in HOUSEHOLD_TABLES:
+            # Tables newer than the database were just created by create_all, household_id and all
+            if 'household_id' not in {column['name'] for column in inspect(connection).get_columns(table)}:
+                connection.execute(text(f'ALTER TABLE {table} ADD COLUMN household_id INTEGER'))
+                added.append(table)
+            connection.execute(text(f'UPDATE {table} SET household_id = :id'), {"id": household_id})
+
+        # The household keeps exactly one state row
+        connection.execute(text('DELETE FROM app_state WHERE id > (SELECT MIN(id) FROM app_state)'))
+        connection.execute(text('INSERT INTO app_state (household_id, version) SELECT :id, 0 '
+                                'WHERE NOT EXISTS (SELECT 1 FROM app_state)'), {"id": household_id})
+        connection.execute(text('UPDATE app_state SET next_collection_date = (SELECT MIN(next_occurrence) FROM bin_rule)'))
+
+        # Every row has a household now, so household_id gets the model's NOT NULL and
+        # foreign key, and names, positions and dates become unique per household only
+        if connection.dialect.name == 'sqlite':
+            for table in added:
+                rebuild_sqlite_table(connection, Base.metadata.tables[table])
+        else:
+            inspector = inspect(connection)
+            for table in added:
+                connection.execute(text(f'ALTER TABLE {table} ALTER COLUMN household_id SET NOT NULL'))
+                connection.execute(text(f'ALTER TABLE {table} ADD CONSTRAINT {table}_household_id_fkey FOREIGN KEY '
+                                        f'(household_id) REFERENCES household (id) ON DELETE CASCADE'))
+                for constraint in inspector.get_unique_constraints(table):
+                    connection.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT {constraint["name"]}'))
+            connection.execute(text('DROP INDEX IF EXISTS ix_resident_position'))
+
+        for table in HOUSEHOLD_TABLES:
+            existing = {index['name'] for index in inspect(connection).get_indexes(table)}
+            for index in Base.metadata.tables[table].indexes:
+                if index.name not in existing:
+                    index.create(connection)
+
+def rebuild_sqlite_table(connection, table):
+    """Recreate a table from its model, keeping its rows; SQLite can't change constraints in place."""
+    columns = ', '.join(column['name'] for column in inspect(connection).get_columns(table.name))
+    # Keeps foreign keys in other tables pointing at the name, not at the renamed copy
+    connection.execute(text('PRAGMA legacy_alter_table = ON'))
+    connection.execute(text(f'ALTER TABLE {table.name} RENAME TO {table.name}_old'))
+    for index in inspect(connection).get_indexes(f'{table.name}_old'):
+        connection.execute(text(f'DROP INDEX {index["name"]}'))
+    table.create(connection)
+    connection.execute(text(f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {table.name}_old'))
+    connection.execute(text(f'DROP TABLE {table.name}_old'))
+    connection.execute(text('PRAGMA legacy_alter_table = OFF'))
+
+def init_db(engine):
+    had_rules = inspect(engine).has_table('bin_rule')
+    Base.metadata.create_all(engine)
+    upgrade_schema(engine)
+    with sessionmaker(bind=engine)() as db_session:
+        household_id = db_session.query(func.min(Household.id)).scalar()
+        if household_id is None:
+            # A new database starts with one household, which the unprefixed web routes show
+            create_household(db_session, DEFAULT_HOUSEHOLD_NAME, chat_id=os.getenv('WHATSAPP_GROUP_CHAT_ID'))
+        elif not had_rules:
+            # Existing installs keep the schedule they had before rules were configurable
+            add_default_rules(db_session, household_id)
+            sync_next_collection_date(db_session, [household_id])
+        db_session.commit()
+
+def create_household(db_session, name, chat_id=None, timezone=None):
+    """Add a household with its state row and the default bin rules. Nothing is committed."""
+    household_id, = create_households(db_session, [{"name": name, "chat_id": chat_id, "timezone": timezone}])
+    return db_session.get(Household, household_id)
+
+def create_households(db_session, households):
+    """create_household for many {name, chat_id, timezone} dicts at once, with executemany inserts.
+
+    Returns the new ids in the same order. Nothing is committed.
+    """
+    now = utcnow()
+    # One batched INSERT ... RETURNING on PostgreSQL; SQLite can't order RETURNING rows, so it goes row by row
+    household_ids = db_session.scalars(insert(Household).returning(Household.id, sort_by_parameter_order=True),
+                                       [{**household, "created_at": now} for household in households]).all()
+    states, rules = [], []
+    for household_id, household in zip(household_ids, households):
+        today = local_today(household['timezone'])
+        occurrences = [rule_next_occurrence(rule, {}, today) for rule in DEFAULT_RULES]
+        states.append({"household_id": household_id, "version": 0, "next_collection_date": min(occurrences)})
+        rules.extend({"household_id": household_id, "next_occurrence": next_occurrence, **rule._asdict()}
+                     for rule, next_occurrence in zip(DEFAULT_RULES, occurrences))
+    db_session.execute(insert(AppState), states)
+    db_session.execute(insert(BinRule), rules)
+    return household_ids
+
+# --- Bin Collection Calendar ---
+# Default rules for new databases: the bins alternate weekly, collected on Fridays
+BIN_SCHEDULE = [
+    {"type": "General waste", "color": "grey"},
+    {"type": "Paper/card and Glass/cans/plastics", "color": "red and yellow"}
+]
+COLLECTION_DAY = 4 # Friday
+# A Monday whose week collects BIN_SCHEDULE[0]. Counting whole weeks from a fixed
+# date keeps the alternation going across years with 53 ISO weeks.
+BIN_SCHEDULE_EPOCH = date.fromisoformat(os.getenv('BIN_SCHEDULE_EPOCH', '2026-01-05'))
+
+RuleSpec = namedtuple('RuleSpec', ['bin_type', 'bin_color', 'anchor_date', 'interval_weeks'])
+
+DEFAULT_RULES = [RuleSpec(bin_type['type'], bin_type['color'],
+                          BIN_SCHEDULE_EPOCH + timedelta(weeks=week, days=COLLECTION_DAY), len(BIN_SCHEDULE))
+                 for week, bin_type in enumerate(BIN_SCHEDULE)]
+
+def merge_bin_types(rules):
+    """One bin type dict for everything collected on the same day."""
+    return {"type": " and ".join(rule.bin_type for rule in rules),
+            "color": " and ".join(rule.bin_color for rule in rules)}
+
+class CollectionCalendar:
+    """Collection days from recurrence rules, with one-off moved or cancelled days.
+
+    The rules repeat every lcm(interval_weeks) weeks, so one cycle is flattened into
+    a sorted pattern of collection days up front. The k-th collection counted from
+    BIN_SCHEDULE_EPOCH is then plain arithmetic; exceptions are looked up by date.
+    """
+
+    def __init__(self, rules, exceptions=()):
+        # rules have bin_type, bin_color, anchor_date and interval_weeks; exceptions are (original_date, moved_to)
+        self.exceptions = dict(exceptions)
+        self.moved_in = {moved_to: original for original, moved_to in self.exceptions.items() if moved_to}
+        self.period_days = 7 * reduce(lcm, (rule.interval_weeks for rule in rules), 1)
+        days = {}
+        for rule in rules:
+            step = 7 * rule.interval_weeks
+            for offset in range((rule.anchor_date - BIN_SCHEDULE_EPOCH).days % step, self.period_days, step):
+                days.setdefault(offset, []).append(rule)
+        self.offsets = sorted(days)
+        self.bins = [merge_bin_types(days[offset]) for offset in self.offsets]
+
+    def __len__(self):
+        return len(self.offsets) # Collections per cycle
+
+    def occurrence(self, k):
+        """(regular date, bin type) of the k-th collection; k may be negative."""
+        cycle, i = divmod(k, len(self.offsets))
+        return BIN_SCHEDULE_EPOCH + timedelta(days=cycle * self.period_days + self.offsets[i]), self.bins[i]
+
+    def first_index(self, day):
+        """Index of the first regular collection on or after day."""
+        cycle, offset = divmod((day - BIN_SCHEDULE_EPOCH).days, self.period_days)
+        return cycle * len(self.offsets) + bisect_left(self.offsets, offset)
+
+    def regular_bins(self, day):
+        cycle, offset = divmod((day - BIN_SCHEDULE_EPOCH).days, self.period_days)
+        i = bisect_left(self.offsets, offset)
+        if i < len(self.offsets) and self.offsets[i] == offset:
+            return self.bins[i]
+        return None
+
+    def bins_on(self, day):
+        """Bin type collected on day after exceptions, or None if there's no collection."""
+        if day in self.moved_in:
+            return self.regular_bins(self.moved_in[day])
+        if day in self.exceptions:
+            return None
+        return self.regular_bins(day)
+
+    def keeps_order(self, original, moved_to):
+        """Whether the collection on original can happen on moved_to without passing the one before or after it.
+
+        The rotation hands out turns in collection order, so collections mustn't overtake each other.
+        """
+        if not self.offsets:
+            return True # No rules left, so there's nothing to overtake
+        k = self.first_index(original)
+        for step in (-1, 1):
+            # The nearest neighbour that still happens, wherever it has been moved to
+            j = k + step
+            while True:
+                day, _ = self.occurrence(j)
+                neighbour = self.exceptions.get(day, day)
+                if neighbour is not None:
+                    break
+                j += step
+            if (moved_to - neighbour).days * step >= 0:
+                return False
+        return True
+
+    def exception_indices(self):
+        """{k: moved_to or None} for exceptions that fall on a regular collection."""
+        return {self.first_index(original): moved_to for original, moved_to in self.exceptions.items()
+                if self.offsets and self.regular_bins(original)}
+
+def load_calendar(db_session, household_id):
+    rules = db_session.query(BinRule.bin_type, BinRule.bin_color, BinRule.anchor_date, BinRule.interval_weeks) \
+                      .filter(BinRule.household_id == household_id).order_by(BinRule.id).all()
+    exceptions = db_session.query(ScheduleException.original_date, ScheduleException.moved_to) \
+                           .filter(ScheduleException.household_id == household_id).all()
+    return CollectionCalendar([RuleSpec(*rule) for rule in rules], exceptions)
+
+def rule_next_occurrence(rule, exceptions, today):
+    """First day on or after today that rule's bin is actually collected, after exceptions."""
+    step = timedelta(weeks=rule.interval_weeks)
+    # Start a little early, in case a bank holiday pushed an earlier collection to today or later
+    cycles = -((rule.anchor_date - today + timedelta(weeks=2)).days // step.days)
+    day = rule.anchor_date + step * cycles
+    for _ in range(len(exceptions) + 4):
+        actual = exceptions.get(day, day)
+        if actual is not None and actual >= today:
+            return actual
+        day += step
+    return None
+
+def add_default_rules(db_session, household_id, today=None):
+    today = today or local_today()
+    db_session.add_all(BinRule(household_id=household_id, next_occurrence=rule_next_occurrence(rule, {}, today),
+                               **rule._asdict())
+                       for rule in DEFAULT_RULES)
+
+HOUSEHOLD_CHUNK = 500 # Households per "IN (...)" query
+
+def chunks(ids, size=HOUSEHOLD_CHUNK):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+def refresh_next_occurrences(db_session, today, stale_only=True, household_id=None):
+    """Recompute next_occurrence for rules whose collection has passed; returns how many changed.
+
+    Covers one household, or every household when household_id is None. The
+    households' next_collection_date follows along. Nothing is committed.
+    """
+    query = db_session.query(BinRule)
+    if household_id is not None:
+        query = query.filter(BinRule.household_id == household_id)
+    if stale_only:
+        query = query.filter(or_(BinRule.next_occurrence.is_(None), BinRule.next_occurrence < today))
+    rules = query.all()
+
+    household_ids = {rule.household_id for rule in rules}
+    exceptions = {}
+    for chunk in chunks(household_ids):
+        for row in db_session.query(ScheduleException).filter(ScheduleException.household_id.in_(chunk)):
+            exceptions.setdefault(row.household_id, {})[row.original_date] = row.moved_to
+    for rule in rules:
+        rule.next_occurrence = rule_next_occurrence(rule, exceptions.get(rule.household_id, {}), today)
+
+    if household_id is not None and not stale_only:
+        household_ids.add(household_id)
+    if household_ids:
+        sync_next_collection_date(db_session, household_ids)
+    return len(rules)
+
+def sync_next_collection_date(db_session, household_ids):
+    db_session.flush()
+    for chunk in chunks(household_ids):
+        db_session.execute(update(AppState)
+                           .where(AppState.household_id.in_(chunk))
+                           .values(next_collection_date=select(func.min(BinRule.next_occurrence))
+                                   .where(BinRule.household_id == AppState.household_id)
+                                   .scalar_subquery())
+                           .execution_options(synchronize_session=False))
+
+def roll_due_dates(db_session, today, household_id=None):
+    """Move passed next_occurrence and next_collection_date values on; True if anything changed."""
+    if refresh_next_occurrences(db_session, today, household_id=household_id):
+        return True
+    query = db_session.query(AppState.household_id).filter(AppState.next_collection_date < today)
+    if household_id is not None:
+        query = query.filter(AppState.household_id == household_id)
+    stale = [row.household_id for row in query]
+    if stale:
+        sync_next_collection_date(db_session, stale)
+    return bool(stale)
+
+def iter_due_states(db_session, first_day, last_day, page_size=500):
+    """Yield (id, household_id, next_collection_date) of state rows due between two days, a page at a time.
+
+    Keyset pagination on (next_collection_date, id) keeps every page an index range
+    scan, however many households there are in total.
+    """
+    after = (first_day, 0)
+    while True:
+        rows = db_session.execute(select(AppState.id, AppState.household_id, AppState.next_collection_date)
+                                  .where(AppState.next_collection_date <= last_day,
+                                         or_(AppState.next_collection_date > after[0],
+                                             (AppState.next_collection_date == after[0]) & (AppState.id > after[1])))
+                                  .order_by(AppState.next_collection_date, AppState.id)
+                                  .limit(page_size)).all()
+        yield from rows
+        if len(rows) < page_size:
+            return
+        after = (rows[-1].next_collection_date, rows[-1].id)
+
+def get_due_bins(db_session, household_id, day):
+    """Bin type collected on day, via the next_occurrence index; None if there's no collection."""
+    rules = db_session.query(BinRule).filter(BinRule.household_id == household_id, BinRule.next_occurrence == day) \
+                      .order_by(BinRule.id).all()
+    return merge_bin_types(rules) if rules else None
+
+# --- Time Zones ---
+@lru_cache(maxsize=None)
+def get_timezone(tzname):
+    return timezone(tzname)
+
+@lru_cache(maxsize=1024)
+def utc_offsets(tzname, year):
+    """The zone's UTC offset changes during a UTC year, as (instants, offsets) lists.
+
+    Built once per zone and year from pytz's transition table, so converting "now"
+    for many households is a bisect rather than a pytz localisation each time.
+    """
+    tz = get_timezone(tzname)
+    start, end = datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    instants = [start]
+    instants.extend(t for t in getattr(tz, '_utc_transition_times', ()) if start < t < end)
+    offsets = [utc.localize(instant).astimezone(tz).utcoffset() for instant in instants]
+    return instants, offsets
+
+def utcnow():
+    return datetime.now(timezone('UTC')).replace(tzinfo=None)
+
+def local_now(tzname=None, now=None):
+    """Naive local wall-clock time in tzname (APP_TIMEZONE by default) for a naive UTC time."""
+    now = now or utcnow()
+    instants, offsets = utc_offsets(tzname or APP_TIMEZONE, now.year)
+    return now + offsets[bisect_right(instants, now) - 1]
+
+def local_today(tzname=None, now=None):
+    return local_now(tzname, now).date()
+
+def day_start_utc(tzname=None, day=None):
+    """Naive UTC time at which day (today by default) begins in tzname."""
+    day = day or local_today(tzname)
+    midnight = get_timezone(tzname or APP_TIMEZONE).localize(datetime.combine(day, datetime.min.time()))
+    return midnight.astimezone(utc).replace(tzinfo=None)
+
+# --- Schedule Projection ---
+class ScheduleEngine:
+    """Projects the Nth collection from a start date in O(1), without walking earlier ones."""
+
+    def __init__(self, residents, last_position, start_date, calendar):
+        # residents must be ordered by position; last_position needn't belong to any of them
+        self.residents = residents
+        self.calendar = calendar
+        if isinstance(start_date, datetime):
+            start_date = start_date.date() # Plain dates, so adding weeks can't cross a DST change
+        if last_position is None:
+            self.last_person_index = -1
+        else:
+            self.last_person_index = bisect_right([r.position for r in residents], last_position) - 1
+
+        self.first_index = calendar.first_index(start_date) if len(calendar) else 0
+        # Exceptions can pull an earlier collection past start_date or push one before it;
+        # the regular occurrences that don't land on or after start_date are skipped.
+        exceptions = calendar.exception_indices()
+        moved_later = [k for k, moved_to in exceptions.items() if moved_to and moved_to >= start_date]
+        earliest = min(moved_later + [self.first_index])
+        self.skipped = sorted({k for k in range(earliest, self.first_index) if k not in moved_later} |
+                              {k for k, moved_to in exceptions.items()
+                               if k >= self.first_index and (moved_to is None or moved_to < start_date)})
+        self.first_index = earliest
+
+    def occurrence_index(self, n):
+        k = self.first_index + n
+        for skipped in self.skipped:
+            if skipped > k:
+                break
+            k += 1
+        return k
+
+    def entry(self, n):
+        regular_date, bin_type = self.calendar.occurrence(self.occurrence_index(n))
+        person_index = (self.last_person_index + 1 + n) % len(self.residents)
+        return {"date": self.calendar.exceptions.get(regular_date, regular_date),
+                "bin_type": bin_type,
+                "person": self.residents[person_index]}
+
+    def entries(self, start, count):
+        # Lazy so callers can page through arbitrarily distant collections cheaply
+        if not len(self.calendar):
+            return
+        for n in range(start, start + count):
+            yield self.entry(n)
+
+# --- Rotation ---
+def get_next_position(db_session, household_id):
+    return (db_session.query(func.max(Resident.position)).filter(Resident.household_id == household_id).scalar() or 0) + 1
+
+def insert_ignoring_conflicts(db_session, model, values, index_elements):
+    # INSERT ... ON CONFLICT DO NOTHING, so concurrent workers can race to create a row
+    dialect = db_session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise RuntimeError(f"Unsupported database dialect: {dialect}")
+    db_session.execute(dialect_insert(model).values(**values).on_conflict_do_nothing(index_elements=index_elements))
+
+def get_state_id(db_session, household_id):
+    state_id = db_session.query(AppState.id).filter(AppState.household_id == household_id).scalar()
+    if state_id is None:
+        insert_ignoring_conflicts(db_session, AppState, {'household_id': household_id, 'version': 0}, ['household_id'])
+        state_id = db_session.query(AppState.id).filter(AppState.household_id == household_id).scalar()
+    return state_id
+
+def bump_version(db_session, household_id, **values):
+    """Mark the household's roster/rotation as changed, optionally setting other state columns too."""
+    db_session.execute(update(AppState)
+                       .where(AppState.id == get_state_id(db_session, household_id))
+                       .values(version=AppState.version + 1, updated_at=utcnow(), **values))
+
+def set_rotation_position(db_session, household_id, position):
+    bump_version(db_session, household_id, last_position=position)
+
+def get_next_person_and_update_state(db_session, household_id):
+    # Next position after the current one, wrapping round; both subqueries use the (household, position) index
+    in_household = Resident.household_id == AppState.household_id
+    next_position = func.coalesce(
+        select(func.min(Resident.position)).where(in_household, Resident.position > AppState.last_position)
+                                           .scalar_subquery(),
+        select(func.min(Resident.position)).where(in_household).scalar_subquery(),
+    )
+
+    # One UPDATE ... RETURNING: the row lock serialises overlapping runs instead of
+    # letting both read the same position. Left uncommitted so the caller can queue
+    # the reminder in the same transaction.
+    position = db_session.execute(
+        update(AppState)
+        .where(AppState.id == get_state_id(db_session, household_id))
+        .values(last_position=next_position, version=AppState.version + 1, updated_at=utcnow())
+        .returning(AppState.last_position)
+    ).scalar_one()
+    if position is None:
+        print("Error: No residents found in the database. Cannot assign duty.")
+        return None
+    return db_session.query(Resident).filter_by(household_id=household_id, position=position).one()
+
+def assign_duty(db_session, household_id, collection_date, bin_type):
+    """Confirm who is on duty for a household's collection, returning (person name, bin type).
+
+    bin_type is what the rules say is collected that day; a materialized row's own
+    bin type takes precedence.
+
+    The precomputed assignment row is claimed with a single conditional UPDATE, so
+    only one of several overlapping runs can confirm it. The rotation is only
+    advanced by hand when the web app hasn't materialized that week yet; the unique
+    (household_id, collection_date) then makes a second concurrent run fail at
+    commit and roll back.
+    """
+    this_collection = (Assignment.household_id == household_id, Assignment.collection_date == collection_date)
+    claimed = db_session.execute(
+        update(Assignment)
+        .where(*this_collection, Assignment.confirmed_at.is_(None))
+        .values(confirmed_at=utcnow())
+        .returning(Assignment.resident_id, Assignment.resident_name, Assignment.bin_type, Assignment.bin_color)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+    if claimed:
+        person = db_session.get(Resident, claimed.resident_id) if claimed.resident_id else None
+        if person is not None:
+            set_rotation_position(db_session, household_id, person.position)
+            return claimed.resident_name, {"type": claimed.bin_type, "color": claimed.bin_color}
+    else:
+        confirmed = db_session.query(Assignment).filter(*this_collection).first()
+        if confirmed:
+            # Already assigned by an earlier run; don't move the rotation again
+            return confirmed.resident_name, {"type": confirmed.bin_type, "color": confirmed.bin_color}
+
+    # No usable projection (not materialized, or its resident has since been removed)
+    person = get_next_person_and_update_state(db_session, household_id)
+    if person is None:
+        return None, None # The roster was cleared since the caller checked it
+    values = {"bin_type": bin_type['type'], "bin_color": bin_type['color'],
+              "resident_id": person.id, "resident_name": person.name, "confirmed_at": utcnow()}
+    if claimed:
+        db_session.execute(update(Assignment)
+                           .where(*this_collection)
+                           .values(**values)
+                           .execution_options(synchronize_session=False))
+    else:
+        db_session.add(Assignment(household_id=household_id, collection_date=collection_date, **values))
+    return person.name, bin_type
+
+# --- Materialized Assignments ---
+def get_state(db_session, household_id):
+    return db_session.query(AppState).filter(AppState.household_id == household_id).first()
+
+def engine_after(db_session, residents, assignment, calendar):
+    """Continue the projection from the day after a stored assignment."""
+    if assignment.confirmed_at:
+        # The cron job moves last_position as it confirms, and the resident may since have gone
+        state = get_state(db_session, assignment.household_id)
+        last_position = state.last_position if state else None
+    else:
+        last_position = next((r.position for r in residents if r.id == assignment.resident_id), None)
+    return ScheduleEngine(residents, last_position, assignment.collection_date + timedelta(days=1), calendar)
+
+def refresh_assignments(db_session, household_id, rebuild=True, tzname=None):
+    """Materialize a household's rolling horizon of projected assignments.
+
+    Confirmed rows are history and never touched. With rebuild=True every projected
+    row is rewritten (the roster or rules changed); otherwise only missing collections
+    are appended. "Today" is local to tzname. Nothing is committed.
+    """
+    assignments = db_session.query(Assignment).filter(Assignment.household_id == household_id)
+    if rebuild:
+        assignments.filter(Assignment.confirmed_at.is_(None)).delete(synchronize_session=False)
+
+    residents = db_session.query(Resident).filter(Resident.household_id == household_id) \
+                          .order_by(Resident.position).all()
+    if not residents:
+        return 0
+
+    today = local_today(tzname)
+    calendar = load_calendar(db_session, household_id)
+    last = assignments.order_by(Assignment.collection_date.desc()).first()
+    if last and last.collection_date >= today:
+        engine = engine_after(db_session, residents, last, calendar)
+        stored = assignments.filter(Assignment.collection_date >= today).count()
+    else:
+        state = get_state(db_session, household_id)
+        engine = ScheduleEngine(residents, state.last_position if state else None, today, calendar)
+        stored = 0
+
+    rows = [{"household_id": household_id,
+             "collection_date": entry["date"],
+             "bin_type": entry["bin_type"]['type'],
+             "bin_color": entry["bin_type"]['color'],
+             "resident_id": entry["person"].id,
+             "resident_name": entry["person"].name}
+            for entry in engine.entries(0, ASSIGNMENT_HORIZON_WEEKS - stored)]
+    if rows:
+        db_session.execute(insert(Assignment), rows)
+    return len(rows)
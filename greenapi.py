@@ -0,0 +1,143 @@
+"""GreenAPI client with a pooled keep-alive session, rate limiting and per-endpoint stats.
+
+requests is only imported when the first call is made, so importing this module
+stays cheap for cron runs that have nothing to send.
+"""
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+class LatencyHistogram:
+    """Fixed-bucket response-time histogram; percentiles resolve to a bucket's upper bound."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # The last bucket catches everything slower
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms):
+        self.counts[bisect_left(self.buckets, duration_ms)] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def percentile(self, pct):
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def summary(self):
+        return {"count": self.count,
+                "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+                "p50_ms": self.percentile(50),
+                "p99_ms": self.percentile(99),
+                "max_ms": round(self.max_ms, 3)}
+
+class RateLimiter:
+    """Spaces out calls to each endpoint, shared by every thread in the process."""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, endpoint):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(endpoint, now))
+            self._next_slot[endpoint] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class GreenAPIClient:
+    """Calls one GreenAPI instance over a single pooled session.
+
+    Safe to share between threads. The asyncio methods run the same pooled calls in
+    an executor, so coroutines and threads share connections, limits and stats.
+    """
+
+    def __init__(self, api_url, instance_id, api_token, timeout=(5, 20), max_per_second=0, pool_size=10):
+        self.base_url = f"{api_url.rstrip('/')}/waInstance{instance_id}"
+        self.api_token = api_token
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.rate_limiter = RateLimiter(max_per_second)
+        self._endpoint_prefix = f"waInstance{instance_id}"
+        self._session = None
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._statuses = {}
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                session = requests.Session()
+                # Keep up to pool_size connections alive per host, for http and https alike
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'Content-Type': 'application/json'})
+                self._session = session
+        return self._session
+
+    def _record(self, method, duration_ms, status):
+        with self._lock:
+            self._latency.setdefault(method, LatencyHistogram()).observe(duration_ms)
+            self._statuses.setdefault(method, Counter())[status] += 1
+
+    def call(self, method, payload):
+        """POST to an API method, returning the response; raises RequestException on failure."""
+        import requests
+
+        self.rate_limiter.wait(f"{self._endpoint_prefix}/{method}")
+        start = time.perf_counter()
+        try:
+            response = self.session.post(f"{self.base_url}/{method}/{self.api_token}", json=payload,
+                                         timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            self._record(method, (time.perf_counter() - start) * 1000, type(e).__name__)
+            raise
+        self._record(method, (time.perf_counter() - start) * 1000, response.status_code)
+
+        try:
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            print(f"Response content: {response.text.encode('utf8')}")
+            raise
+        return response
+
+    def send_message(self, chat_id, message):
+        return self.call('sendMessage', {"chatId": chat_id, "message": message, "linkPreview": False})
+
+    async def call_async(self, method, payload, executor=None):
+        return await asyncio.get_running_loop().run_in_executor(executor, self.call, method, payload)
+
+    async def send_message_async(self, chat_id, message, executor=None):
+        return await asyncio.get_running_loop().run_in_executor(executor, self.send_message, chat_id, message)
+
+    def stats(self):
+        """Per-method latency summary and response counts (status code, or exception name)."""
+        with self._lock:
+            return {method: {**histogram.summary(), "statuses": dict(self._statuses[method])}
+                    for method, histogram in self._latency.items()}
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
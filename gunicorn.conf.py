@@ -0,0 +1,15 @@
+"""Gunicorn settings for the web service: gunicorn app:app (this file is picked up automatically)."""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+# Import the app (and compile its templates) once in the master, then fork the workers
+preload_app = True
+
+def post_fork(server, worker):
+    from app import warm_up_pool
+    try:
+        warm_up_pool()
+    except Exception as e:
+        # The first requests will connect instead; don't stop the worker booting
+        server.log.warning(f"Database pool warm-up failed: {e}")
@@ -0,0 +1,65 @@
+"""Reminder message templates shared by the cron job and the /test-reminders preview."""
+from functools import lru_cache
+from string import Formatter
+
+DEFAULT_LOCALE = 'en'
+
+MESSAGE_TEMPLATES = {
+    ('take-out', 'en'): ("Hello {name}! It's your turn to take out the bins. "
+                         "Tomorrow is {bin_type} collection day. "
+                         "Please put the {bin_color} bins out tonight. Thanks!"),
+    ('bring-in', 'en'): ("Hey {name}, hope your day is going well! "
+                         "Just a friendly reminder to please bring in the {bin_color} bins tonight. Thank you!"),
+}
+
+TEMPLATE_FIELDS = {'name', 'bin_type', 'bin_color'}
+
+@lru_cache(maxsize=None)
+def compile_template(template):
+    """Parse a template once into (literal, field) pairs."""
+    parts = []
+    for literal, field, format_spec, conversion in Formatter().parse(template):
+        if field is not None and field not in TEMPLATE_FIELDS:
+            raise ValueError(f"Unknown field '{{{field}}}' in message template.")
+        if format_spec or conversion:
+            raise ValueError("Message template fields can't have format specs or conversions.")
+        parts.append((literal, field))
+    return tuple(parts)
+
+@lru_cache(maxsize=256)
+def bind_bin_type(template, bin_type, bin_color):
+    """Fill in the bin fields, leaving the literal pieces that go around each name."""
+    values = {'bin_type': bin_type, 'bin_color': bin_color}
+    pieces = []
+    current = ''
+    for literal, field in compile_template(template):
+        current += literal
+        if field == 'name':
+            pieces.append(current)
+            current = ''
+        elif field is not None:
+            current += values[field]
+    pieces.append(current)
+    return tuple(pieces)
+
+def get_template(reminder_type, locale=DEFAULT_LOCALE):
+    template = MESSAGE_TEMPLATES.get((reminder_type, locale)) or MESSAGE_TEMPLATES.get((reminder_type, DEFAULT_LOCALE))
+    if template is None:
+        raise ValueError(f"No message template for reminder type '{reminder_type}'.")
+    return template
+
+def render_batch(reminder_type, bin_type, names, locale=DEFAULT_LOCALE, template=None):
+    """Render one reminder per name, all for the same bin type, in a single pass.
+
+    template overrides the built-in wording (e.g. a household's custom text) and is
+    only parsed the first time it is seen.
+    """
+    pieces = bind_bin_type(template or get_template(reminder_type, locale), bin_type['type'], bin_type['color'])
+    return [name.join(pieces) for name in names]
+
+def render_reminder(reminder_type, name, bin_type, locale=DEFAULT_LOCALE, template=None):
+    return render_batch(reminder_type, bin_type, [name], locale, template)[0]
+
+# Compile the built-in templates up front so the first send doesn't pay for it
+for _template in MESSAGE_TEMPLATES.values():
+    compile_template(_template)
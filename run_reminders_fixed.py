@@ -1,134 +1,396 @@
+"""Cron job entry point for sending bin reminders.
+
+Kept deliberately light: no Flask app is built, the database is reached through a
+plain SQLAlchemy engine, and requests is only imported once a message is sent.
+"""
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import os
 import sys
-import requests
-from datetime import datetime, timedelta
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from pytz import timezone
+import json
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError, OperationalError
+from core import (AppState, Assignment, Household, OutboxMessage, Resident, assign_duty, create_db_engine,
+                  get_due_bins, get_state, iter_due_states, local_today, make_sessionmaker, roll_due_dates, utcnow)
+from greenapi import GreenAPIClient
+from messages import render_reminder
+from timing import record, span
+
+record('import', (time.perf_counter() - _IMPORT_STARTED) * 1000)
 
 # Load environment variables from .env file
 load_dotenv()
 
 # --- Configuration & Setup ---
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+DATABASE_URL = os.getenv('DATABASE_URL')
 
+GREENAPI_API_URL = os.getenv('GREENAPI_API_URL', 'https://7105.api.greenapi.com')
 GREENAPI_INSTANCE_ID = os.getenv('GREENAPI_INSTANCE_ID')
 GREENAPI_API_TOKEN = os.getenv('GREENAPI_API_TOKEN')
-WHATSAPP_GROUP_CHAT_ID = os.getenv('WHATSAPP_GROUP_CHAT_ID')
-
-# --- Database Models ---
-class Resident(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(80), unique=True, nullable=False)
-
-class AppState(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    last_person_index = db.Column(db.Integer, default=-1)
-
-# --- Bin Collection Logic (hardcoded) ---
-BIN_SCHEDULE = [
-    {"type": "General waste", "color": "grey"},
-    {"type": "Paper/card and Glass/cans/plastics", "color": "red and yellow"}
-]
-
-def get_current_bin_type(date):
-    week_number = date.isocalendar()[1]
-    return BIN_SCHEDULE[week_number % 2]
-
-def get_next_person_and_update_state(db_session):
-    residents = db_session.query(Resident).order_by(Resident.id).all()
-    if not residents:
-        print("Error: No residents found in the database. Cannot assign duty.")
+WHATSAPP_GROUP_CHAT_ID = os.getenv('WHATSAPP_GROUP_CHAT_ID') # For households without a chat ID of their own
+
+# Maximum number of households processed at once
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '16'))
+
+# GreenAPI call limits: (connect, read) timeout in seconds and sends per second per endpoint
+GREENAPI_TIMEOUT = (float(os.getenv('GREENAPI_CONNECT_TIMEOUT', '5')), float(os.getenv('GREENAPI_READ_TIMEOUT', '20')))
+GREENAPI_MAX_PER_SECOND = float(os.getenv('GREENAPI_MAX_PER_SECOND', '5'))
+
+# Outbox retry policy
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '6'))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv('OUTBOX_BACKOFF_SECONDS', '60'))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv('OUTBOX_MAX_BACKOFF_SECONDS', '3600'))
+
+# Connection attempts at start-up, so many containers starting together back off instead of failing
+DB_CONNECT_ATTEMPTS = int(os.getenv('DB_CONNECT_ATTEMPTS', '5'))
+DB_CONNECT_BACKOFF_SECONDS = float(os.getenv('DB_CONNECT_BACKOFF_SECONDS', '0.5'))
+
+_session_factory = None
+
+def get_session_factory():
+    # Engine and pool are built on first use, not at import
+    global _session_factory
+    if _session_factory is None:
+        if not DATABASE_URL:
+            raise RuntimeError("DATABASE_URL is not set.")
+        _session_factory = make_sessionmaker(get_database_engine(DATABASE_URL))
+    return _session_factory
+
+def get_session():
+    return get_session_factory()()
+
+def connect_with_retry(db_session):
+    """Open the session's connection, retrying with jittered exponential backoff."""
+    for attempt in range(1, DB_CONNECT_ATTEMPTS + 1):
+        try:
+            return db_session.connection()
+        except OperationalError as e:
+            if attempt == DB_CONNECT_ATTEMPTS:
+                raise
+            # Full jitter spreads the retries of containers that failed at the same moment
+            delay = random.uniform(0, DB_CONNECT_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            reason = str(e.orig).strip().splitlines()[0]
+            print(f"Database connection attempt {attempt} failed ({reason}); retrying in {delay:.1f}s.", file=sys.stderr)
+            db_session.rollback()
+            time.sleep(delay)
+
+# --- WhatsApp Integration ---
+_greenapi_client = None
+_greenapi_client_lock = threading.Lock()
+
+def get_greenapi_client():
+    # One client per process so batch sends share its keep-alive connections and stats
+    global _greenapi_client
+    with _greenapi_client_lock:
+        if _greenapi_client is None:
+            _greenapi_client = GreenAPIClient(GREENAPI_API_URL, GREENAPI_INSTANCE_ID, GREENAPI_API_TOKEN,
+                                              timeout=GREENAPI_TIMEOUT, max_per_second=GREENAPI_MAX_PER_SECOND,
+                                              pool_size=BATCH_CONCURRENCY)
+    return _greenapi_client
+
+def print_greenapi_stats():
+    if _greenapi_client is None:
+        return
+    for method, stats in _greenapi_client.stats().items():
+        statuses = ", ".join(f"{status}: {count}" for status, count in stats['statuses'].items())
+        print(f"GreenAPI {method}: {stats['count']} call(s) ({statuses}), "
+              f"p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms, max {stats['max_ms']} ms")
+
+def send_whatsapp_message(message, chat_id=None):
+    """Send one message, raising requests.exceptions.RequestException on failure."""
+    with span('http_send') as fields:
+        response = get_greenapi_client().send_message(chat_id or WHATSAPP_GROUP_CHAT_ID, message)
+        fields['status_code'] = response.status_code
+    print(f"Message sent successfully. Response: {response.text.encode('utf8')}")
+
+# --- Outbox ---
+def enqueue_message(db_session, chat_id, message, idempotency_key):
+    # Added without committing so it lands in the caller's transaction
+    now = utcnow()
+    item = OutboxMessage(idempotency_key=idempotency_key, chat_id=chat_id, message=message,
+                         status='pending', attempts=0, next_attempt_at=now, created_at=now)
+    db_session.add(item)
+    return item
+
+def retry_delay(attempts):
+    # Exponential backoff with jitter so failed sends don't retry in lockstep
+    delay = min(OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), OUTBOX_MAX_BACKOFF_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+def send_concurrently(pool, messages):
+    """Send (chat_id, message) pairs over the shared client, returning None or the RequestException for each."""
+    from requests.exceptions import RequestException
+
+    def send(pair):
+        chat_id, message = pair
+        try:
+            send_whatsapp_message(message, chat_id=chat_id)
+        except RequestException as e:
+            return e
         return None
 
-    state = db_session.query(AppState).first()
-    if not state:
-        state = AppState(last_person_index=-1)
-        db_session.add(state)
+    return list(pool.map(send, messages))
+
+def drain_outbox(db_session, batch_size=OUTBOX_BATCH_SIZE):
+    """Send every due outbox message in batches, returning (sent, failed) counts.
+
+    Each claimed batch is sent from BATCH_CONCURRENCY threads at once; the rows are
+    only updated from this thread, once the whole batch has been tried.
+    """
+    sent = failed = 0
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as pool:
+        while True:
+            # SKIP LOCKED lets overlapping drains split the work instead of double-sending
+            batch = (db_session.query(OutboxMessage)
+                     .filter(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= utcnow())
+                     .order_by(OutboxMessage.id)
+                     .limit(batch_size)
+                     .with_for_update(skip_locked=True)
+                     .all())
+            if not batch:
+                break
+
+            errors = send_concurrently(pool, [(item.chat_id, item.message) for item in batch])
+            for item, error in zip(batch, errors):
+                item.attempts += 1
+                if error is not None:
+                    print(f"Failed to send message {item.idempotency_key} (attempt {item.attempts}): {error}")
+                    item.last_error = str(error)
+                    if item.attempts >= OUTBOX_MAX_ATTEMPTS:
+                        item.status = 'failed'
+                    else:
+                        item.next_attempt_at = utcnow() + retry_delay(item.attempts)
+                    failed += 1
+                else:
+                    item.status = 'sent'
+                    item.sent_at = utcnow()
+                    item.last_error = None
+                    sent += 1
+            db_session.commit()
+
+    return sent, failed
+
+# --- Reminder message building ---
+def due_household_ids(db_session, reminder_type):
+    """Households that may have a collection in the reminder's window, via the indexed next_collection_date.
+
+    Households keep their own time zones, so the window spans every zone's today
+    (and tomorrow, for take-out). Its first day also covers a collection today
+    when next_collection_date, which only holds the earliest, is today.
+    """
+    today = utcnow().date()
+    first_day = today - timedelta(days=1)
+    if roll_due_dates(db_session, first_day):
         db_session.commit()
+    last_day = today + timedelta(days=2 if reminder_type == 'take-out' else 1)
+    return [state.household_id for state in iter_due_states(db_session, first_day, last_day)]
 
-    next_index = (state.last_person_index + 1) % len(residents)
-    person = residents[next_index]
-    state.last_person_index = next_index
-    db_session.commit()
-    return person
+def is_due(db_session, household_id, reminder_type, today):
+    """Whether a collection may fall in the reminder's window on the household's own date."""
+    if roll_due_dates(db_session, today, household_id):
+        db_session.commit()
+    last_day = today + timedelta(days=1) if reminder_type == 'take-out' else today
+    return db_session.query(AppState.id).filter(AppState.household_id == household_id,
+                                                AppState.next_collection_date.between(today, last_day)).first() is not None
 
-# --- WhatsApp Integration ---
-def send_whatsapp_message(message):
-    url = f"https://7105.api.greenapi.com/waInstance{GREENAPI_INSTANCE_ID}/sendMessage/{GREENAPI_API_TOKEN}"
-    payload = {
-        "chatId": WHATSAPP_GROUP_CHAT_ID,
-        "message": message,
-        "linkPreview": False
-    }
-    headers = {
-        'Content-Type': 'application/json'
-    }
+def build_reminder_message(db_session, household_id, reminder_type, today):
+    # Check if there are any residents before proceeding
+    with span('roster_load'):
+        has_residents = db_session.query(Resident.id).filter(Resident.household_id == household_id).first() is not None
+    if not has_residents:
+        print(f"No residents found in household {household_id}. Skipping.")
+        return None
 
+    if reminder_type == 'take-out':
+        with span('roster_load'):
+            bin_type = get_due_bins(db_session, household_id, today + timedelta(days=1))
+        if not bin_type:
+            print(f"No collection tomorrow for household {household_id}. Skipping.")
+            return None
+        with span('rotation_update'):
+            person_name, bin_type = assign_duty(db_session, household_id, today + timedelta(days=1), bin_type)
+        if not person_name or not bin_type:
+            return None
+
+    elif reminder_type == 'bring-in':
+        with span('roster_load'):
+            assignment = db_session.query(Assignment).filter_by(household_id=household_id, collection_date=today).first()
+            if assignment:
+                person_name = assignment.resident_name
+                bin_type = {"type": assignment.bin_type, "color": assignment.bin_color}
+            else:
+                state = get_state(db_session, household_id)
+                person = state and db_session.query(Resident).filter_by(household_id=household_id,
+                                                                        position=state.last_position).first()
+                person_name = person.name if person else None
+                bin_type = get_due_bins(db_session, household_id, today)
+        if not bin_type:
+            print(f"No collection today for household {household_id}. Skipping.")
+            return None
+        if not person_name:
+            print(f"Nobody in household {household_id} has been on duty yet. Skipping.")
+            return None
+
+    else:
+        return None
+
+    with span('message_render'):
+        message = render_reminder(reminder_type, person_name, bin_type)
+    print(f"Queueing '{reminder_type}' reminder for household {household_id}: {message}")
+    return message
+
+def queue_reminder(db_session, household_id, reminder_type, chat_id, tzname=None):
+    """Advance the household's rotation and queue its reminder in one commit; returns the message or None.
+
+    "Today" is the household's local date in tzname (APP_TIMEZONE by default).
+    """
+    if not chat_id:
+        raise ValueError("No WhatsApp chat ID configured for this household.")
+
+    today = local_today(tzname)
+    with span('due_check'):
+        due = is_due(db_session, household_id, reminder_type, today)
+    if not due:
+        # Nothing is loaded for a household without a collection in the window
+        print(f"No collection due for household {household_id}'s '{reminder_type}' reminder. Skipping.")
+        return None
+
+    message = build_reminder_message(db_session, household_id, reminder_type, today)
+    if not message:
+        db_session.rollback()
+        return None
+
+    idempotency_key = f"{reminder_type}:{household_id}:{today.isoformat()}"
+    enqueue_message(db_session, chat_id, message, idempotency_key)
+    try:
+        with span('enqueue_commit'):
+            db_session.commit()
+    except IntegrityError:
+        # Already queued or assigned by another run; rolling back also undoes the rotation advance
+        db_session.rollback()
+        print(f"Reminder {idempotency_key} was already handled by another run. Skipping.")
+        return None
+    return message
+
+# --- Households ---
+_database_engines = {}
+_database_engines_lock = threading.Lock()
+
+def get_database_engine(database_url):
+    # One engine per database, with a connection for each household worked on at once
+    with _database_engines_lock:
+        engine = _database_engines.get(database_url)
+        if engine is None:
+            engine = create_db_engine(database_url, pool_size=1, max_overflow=BATCH_CONCURRENCY)
+            _database_engines[database_url] = engine
+    return engine
+
+def remind_household(session_factory, household_id, reminder_type, default_chat_id=None, default_timezone=None):
+    """Queue one household's reminder in its own session, returning (name, status, detail)."""
+    name = f"household {household_id}"
     try:
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()
-        print(f"Message sent successfully. Response: {response.text.encode('utf8')}")
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to send message: {e}")
-        if 'response' in locals() and response:
-            print(f"Response content: {response.text.encode('utf8')}")
+        with session_factory() as db_session:
+            household = db_session.get(Household, household_id)
+            name = household.name
+            message = queue_reminder(db_session, household_id, reminder_type, household.chat_id or default_chat_id,
+                                     household.timezone or default_timezone)
+        if not message:
+            return name, 'skipped', 'nothing due'
+        return name, 'queued', 'reminder queued'
+    except Exception as e:
+        return name, 'failed', str(e)
+
+def remind_database(session_factory, reminder_type, default_chat_id=None, default_timezone=None):
+    """Queue the reminder for every due household in one database, then drain its outbox.
+
+    Returns the number of households or messages that failed.
+    """
+    with session_factory() as db_session:
+        with span('db_connect'):
+            connect_with_retry(db_session)
+        household_ids = []
+        if reminder_type != 'drain':
+            with span('due_scan') as fields:
+                household_ids = due_household_ids(db_session, reminder_type)
+                fields['households'] = len(household_ids)
+            print(f"{len(household_ids)} household(s) may be due for the '{reminder_type}' reminder.")
+
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as pool:
+        results = list(pool.map(lambda household_id: remind_household(session_factory, household_id, reminder_type,
+                                                                      default_chat_id, default_timezone),
+                                household_ids))
+    failures = 0
+    for name, status, detail in results:
+        if status != 'skipped':
+            print(f"[{status.upper()}] {name}: {detail}")
+        if status == 'failed':
+            failures += 1
+
+    with session_factory() as db_session:
+        sent, failed = drain_outbox(db_session)
+    print(f"Outbox drained: {sent} sent, {failed} failed.")
+    return failures + failed
 
 # --- Main reminder logic for cron job ---
 def main(reminder_type):
     try:
-        with app.app_context():
-            print("Starting cron job main function...")
-            
-            # Check if there are any residents before proceeding
-            residents = db.session.query(Resident).order_by(Resident.id).all()
-            if not residents:
-                print("No residents found. Exiting cron job.")
-                return
-
-            if reminder_type == 'take-out':
-                person = get_next_person_and_update_state(db.session)
-                bin_type = get_current_bin_type(datetime.now())
-                if person and bin_type:
-                    message = (f"Hello {person.name}! It's your turn to take out the bins. "
-                               f"Tomorrow is {bin_type['type']} collection day. "
-                               f"Please put the {bin_type['color']} bins out tonight. Thanks!")
-                    print(f"Sending 'take-out' reminder: {message}")
-                    send_whatsapp_message(message)
-            
-            elif reminder_type == 'bring-in':
-                state = db.session.query(AppState).first()
-                if not state:
-                    print("App state not initialized. Exiting cron job.")
-                    return
-                
-                # We need to get residents again here in case the first call failed
-                residents = db.session.query(Resident).order_by(Resident.id).all()
-                if not residents:
-                    print("No residents found. Exiting cron job.")
-                    return
-                
-                person = residents[state.last_person_index]
-                bin_type = get_current_bin_type(datetime.now())
-                message = (f"Hey {person.name}, hope your day is going well! "
-                           f"Just a friendly reminder to please bring in the {bin_type['color']} bins tonight. Thank you!")
-                print(f"Sending 'bring-in' reminder: {message}")
-                send_whatsapp_message(message)
-    
+        print("Starting cron job main function...")
+        with span('job', reminder_type=reminder_type):
+            failures = remind_database(get_session_factory(), reminder_type, WHATSAPP_GROUP_CHAT_ID)
+
     except Exception as e:
         print(f"An unexpected error occurred during cron job execution: {e}", file=sys.stderr)
         # Re-raise the exception to ensure it's logged by Render's system
         raise
 
-    print("Cron job finished.")
+    print_greenapi_stats()
+    print(f"Cron job finished with {failures} failure(s).")
+    return failures
+
+# --- Batch mode: several databases in one process ---
+def load_databases(path):
+    with open(path) as f:
+        databases = json.load(f)
+    for position, database in enumerate(databases):
+        if not database.get('database_url'):
+            raise ValueError(f"Entry #{position} in {path} needs a 'database_url'.")
+        database.setdefault('name', f"database #{position}")
+        # Used for households in that database without a chat ID or time zone of their own
+        database.setdefault('chat_id', None)
+        database.setdefault('timezone', None)
+    return databases
+
+def main_batch(reminder_type, databases_path):
+    print(f"Starting batch cron job for the databases in {databases_path}...")
+    failures = 0
+    for database in load_databases(databases_path):
+        print(f"--- {database['name']} ---")
+        try:
+            session_factory = make_sessionmaker(get_database_engine(database['database_url']))
+            failures += remind_database(session_factory, reminder_type, database['chat_id'], database['timezone'])
+        except Exception as e:
+            print(f"[FAILED] {database['name']}: {e}")
+            failures += 1
+
+    print_greenapi_stats()
+    print(f"Batch cron job finished with {failures} failure(s).")
+    return failures
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        main(sys.argv[1])
-    else:
-        print("Error: A reminder type ('take-out' or 'bring-in') must be specified as a command-line argument.")
+    parser = argparse.ArgumentParser(description="Send bin collection reminders to WhatsApp.")
+    parser.add_argument('reminder_type', choices=['take-out', 'bring-in', 'drain'],
+                        help="Which reminder to send, or 'drain' to only retry queued messages.")
+    parser.add_argument('--batch', metavar='DATABASES_FILE',
+                        help="JSON file listing several databases to remind in one run.")
+    args = parser.parse_args()
+
+    if args.batch:
+        sys.exit(1 if main_batch(args.reminder_type, args.batch) else 0)
+    sys.exit(1 if main(args.reminder_type) else 0)
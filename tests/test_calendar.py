@@ -0,0 +1,100 @@
+"""CollectionCalendar and ScheduleEngine: recurrence rules with moved and cancelled collections."""
+import os
+import sys
+from collections import namedtuple
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core import CollectionCalendar, RuleSpec, ScheduleEngine, rule_next_occurrence
+
+Person = namedtuple('Person', ['name', 'position'])
+
+GENERAL = RuleSpec('General waste', 'grey', date(2026, 10, 2), 2) # Fridays: 16 Oct, 30 Oct, 13 Nov, ...
+GARDEN = RuleSpec('Garden waste', 'green', date(2026, 10, 6), 3) # Tuesdays: 27 Oct, 17 Nov, 8 Dec, 29 Dec, ...
+EXCEPTIONS = [
+    (date(2026, 10, 16), date(2026, 10, 17)), # Moved a day later
+    (date(2026, 10, 27), date(2026, 10, 26)), # Moved a day earlier
+    (date(2026, 11, 13), None),               # Cancelled
+    (date(2026, 12, 25), date(2026, 12, 28)), # Moved over a weekend, still before 29 Dec
+]
+RESIDENTS = [Person('Ann', 1), Person('Bob', 2), Person('Cy', 4)] # Position 3 was removed
+
+def make_calendar():
+    return CollectionCalendar([GENERAL, GARDEN], EXCEPTIONS)
+
+def walk(calendar, start, count):
+    """The first count (date, bins) collections on or after start, found a day at a time."""
+    day, found = start, []
+    while len(found) < count:
+        bins = calendar.bins_on(day)
+        if bins:
+            found.append((day, bins))
+        day += timedelta(days=1)
+    return found
+
+def test_moved_and_cancelled_dates():
+    calendar = make_calendar()
+    assert calendar.bins_on(date(2026, 10, 16)) is None
+    assert calendar.bins_on(date(2026, 10, 17))['type'] == 'General waste'
+    assert calendar.bins_on(date(2026, 10, 26))['type'] == 'Garden waste'
+    assert calendar.bins_on(date(2026, 10, 27)) is None
+    assert calendar.bins_on(date(2026, 11, 13)) is None
+    assert calendar.regular_bins(date(2026, 11, 13))['type'] == 'General waste'
+    assert calendar.bins_on(date(2026, 11, 14)) is None
+
+def test_rules_on_the_same_day_are_merged():
+    calendar = CollectionCalendar([GENERAL, RuleSpec('Glass', 'blue', date(2026, 10, 16), 4)])
+    assert calendar.bins_on(date(2026, 10, 16)) == {"type": "General waste and Glass", "color": "grey and blue"}
+    assert calendar.bins_on(date(2026, 10, 30)) == {"type": "General waste", "color": "grey"}
+
+def test_keeps_order():
+    calendar = make_calendar()
+    # 23 Oct has no collection; 30 Oct is the next one after 27 Oct (moved to the 26th)
+    assert calendar.keeps_order(date(2026, 10, 27), date(2026, 10, 29))
+    assert not calendar.keeps_order(date(2026, 10, 27), date(2026, 10, 31))
+    assert not calendar.keeps_order(date(2026, 10, 30), date(2026, 10, 25)) # Before the moved 26 Oct
+    # 13 Nov is cancelled, so 17 Nov may move back past it to just after 30 Oct
+    assert calendar.keeps_order(date(2026, 11, 17), date(2026, 10, 31))
+    assert not calendar.keeps_order(date(2026, 11, 17), date(2026, 10, 30))
+
+def test_keeps_order_without_rules():
+    # Every rule removed while an exception remains: restoring it has nothing to overtake
+    calendar = CollectionCalendar([], [(date(2026, 10, 30), None)])
+    assert calendar.keeps_order(date(2026, 10, 30), date(2026, 10, 30))
+
+def test_no_rules():
+    calendar = CollectionCalendar([], EXCEPTIONS)
+    assert len(calendar) == 0
+    assert calendar.bins_on(date(2026, 10, 17)) is None
+    assert calendar.exception_indices() == {}
+    engine = ScheduleEngine(RESIDENTS, None, date(2026, 10, 1), calendar)
+    assert list(engine.entries(0, 10)) == []
+
+def test_projection_matches_a_date_walk():
+    calendar = make_calendar()
+    # Every start day around the exceptions, including ones between an original and its new date
+    for start in (date(2026, 10, 1) + timedelta(days=n) for n in range(100)):
+        for last_position in (None, 1, 3, 4):
+            engine = ScheduleEngine(RESIDENTS, last_position, start, calendar)
+            entries = list(engine.entries(0, 15))
+            assert [(entry["date"], entry["bin_type"]) for entry in entries] == walk(calendar, start, 15), start
+            first = {None: 0, 1: 1, 3: 2, 4: 0}[last_position] # Cy (4) wraps round to Ann
+            assert [entry["person"].name for entry in entries] == \
+                [RESIDENTS[(first + n) % len(RESIDENTS)].name for n in range(15)]
+
+def test_distant_entry_matches_a_date_walk():
+    calendar = make_calendar()
+    engine = ScheduleEngine(RESIDENTS, None, date(2026, 10, 1), calendar)
+    day, bins = walk(calendar, date(2026, 10, 1), 400)[-1]
+    assert (engine.entry(399)["date"], engine.entry(399)["bin_type"]) == (day, bins)
+
+def test_rule_next_occurrence():
+    exceptions = dict(EXCEPTIONS)
+    assert rule_next_occurrence(GENERAL, exceptions, date(2026, 10, 16)) == date(2026, 10, 17)
+    assert rule_next_occurrence(GENERAL, exceptions, date(2026, 11, 1)) == date(2026, 11, 27) # 13 Nov cancelled
+    # Matches a walk over a calendar of that rule alone
+    calendar = CollectionCalendar([GENERAL], EXCEPTIONS)
+    for today in (date(2026, 9, 20) + timedelta(days=n) for n in range(120)):
+        assert rule_next_occurrence(GENERAL, exceptions, today) == walk(calendar, today, 1)[0][0], today
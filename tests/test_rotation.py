@@ -0,0 +1,83 @@
+"""The rota through the reminder job: take-out, bring-in and the weeks after a roster change."""
+import os
+import sys
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest
+from sqlalchemy.orm import Session
+import core
+import run_reminders_fixed
+from core import (Assignment, BinRule, Household, Resident, assign_duty, create_db_engine, init_db,
+                  refresh_assignments, sync_next_collection_date)
+
+CHAT_ID = 'rota@g.us'
+NAMES = ['Ann', 'Bob', 'Cy', 'Dee']
+
+@pytest.fixture
+def household(tmp_path, monkeypatch):
+    """A household with a weekly Friday collection and Ann, Bob, Cy and Dee, as of Thursday 22 October 2026."""
+    clock = {"today": date(2026, 10, 22)}
+    # The web app and the job both read "today" through local_today
+    monkeypatch.setattr(core, 'local_today', lambda tzname=None, now=None: clock["today"])
+    monkeypatch.setattr(run_reminders_fixed, 'local_today', lambda tzname=None, now=None: clock["today"])
+
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    init_db(engine)
+    db_session = Session(engine)
+    household_id = db_session.query(Household.id).scalar()
+    db_session.query(BinRule).delete()
+    db_session.add(BinRule(household_id=household_id, bin_type='General waste', bin_color='grey',
+                           anchor_date=date(2026, 10, 2), interval_weeks=1, next_occurrence=date(2026, 10, 23)))
+    db_session.add_all(Resident(household_id=household_id, name=name, position=position)
+                       for position, name in enumerate(NAMES, start=1))
+    db_session.flush()
+    sync_next_collection_date(db_session, [household_id])
+    refresh_assignments(db_session, household_id)
+    db_session.commit()
+    yield db_session, household_id, clock
+    db_session.close()
+    engine.dispose()
+
+def remind(db_session, household_id, reminder_type):
+    """Queue the reminder as the job would, returning the name of the resident it was for."""
+    message = run_reminders_fixed.queue_reminder(db_session, household_id, reminder_type, CHAT_ID)
+    return message and next(name for name in NAMES if name in message)
+
+def projected(db_session, household_id):
+    return [(row.collection_date.day, row.resident_name, row.confirmed_at is not None)
+            for row in db_session.query(Assignment).filter(Assignment.household_id == household_id)
+                                 .order_by(Assignment.collection_date).limit(4)]
+
+def test_rotation_across_a_roster_change(household):
+    db_session, household_id, clock = household
+    assert projected(db_session, household_id) == \
+        [(23, 'Ann', False), (30, 'Bob', False), (6, 'Cy', False), (13, 'Dee', False)]
+
+    assert remind(db_session, household_id, 'take-out') == 'Ann'
+    assert remind(db_session, household_id, 'take-out') is None # Already queued today
+    clock["today"] = date(2026, 10, 23)
+    assert remind(db_session, household_id, 'bring-in') == 'Ann'
+
+    # Cy leaves before their turn: as the setup page does, the projection is rebuilt
+    clock["today"] = date(2026, 10, 25)
+    db_session.delete(db_session.query(Resident).filter_by(name='Cy').one())
+    refresh_assignments(db_session, household_id)
+    db_session.commit()
+    assert projected(db_session, household_id) == \
+        [(23, 'Ann', True), (30, 'Bob', False), (6, 'Dee', False), (13, 'Ann', False)]
+
+    for today, name in ((date(2026, 10, 29), 'Bob'), (date(2026, 11, 5), 'Dee'), (date(2026, 11, 12), 'Ann')):
+        clock["today"] = today
+        assert remind(db_session, household_id, 'take-out') == name
+    assert projected(db_session, household_id) == \
+        [(23, 'Ann', True), (30, 'Bob', True), (6, 'Dee', True), (13, 'Ann', True)]
+
+def test_assign_duty_with_no_residents_left(household):
+    db_session, household_id, _ = household
+    db_session.query(Assignment).delete()
+    db_session.query(Resident).delete()
+    assert assign_duty(db_session, household_id, date(2026, 10, 23), {"type": "General waste", "color": "grey"}) \
+        == (None, None)
@@ -0,0 +1,100 @@
+"""init_db against databases created by older versions of the app."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+from core import HOUSEHOLD_TABLES, AppState, Assignment, BinRule, Household, Resident, init_db
+
+# Tables as the first release's db.create_all() made them on SQLite
+BASELINE_SCHEMA = [
+    'CREATE TABLE resident (id INTEGER NOT NULL, name VARCHAR(80) NOT NULL, PRIMARY KEY (id), UNIQUE (name))',
+    'CREATE TABLE app_state (id INTEGER NOT NULL, last_person_index INTEGER, PRIMARY KEY (id))',
+    "INSERT INTO resident (id, name) VALUES (1, 'Ann'), (2, 'Bob'), (3, 'Cy')",
+    'INSERT INTO app_state (id, last_person_index) VALUES (1, 1)',
+]
+
+# The last schema before households, with one collection already assigned
+PRE_HOUSEHOLD_SCHEMA = [
+    'CREATE TABLE resident (id INTEGER NOT NULL, name VARCHAR(80) NOT NULL, position INTEGER, PRIMARY KEY (id), '
+    'UNIQUE (name))',
+    'CREATE UNIQUE INDEX ix_resident_position ON resident (position)',
+    "CREATE TABLE app_state (id INTEGER NOT NULL, last_person_index INTEGER, last_position INTEGER, "
+    "version INTEGER DEFAULT '0' NOT NULL, updated_at DATETIME, next_collection_date DATE, PRIMARY KEY (id))",
+    'CREATE INDEX ix_app_state_due ON app_state (next_collection_date, id)',
+    'CREATE TABLE bin_rule (id INTEGER NOT NULL, bin_type VARCHAR(80) NOT NULL, bin_color VARCHAR(80) NOT NULL, '
+    'anchor_date DATE NOT NULL, interval_weeks INTEGER NOT NULL, next_occurrence DATE, PRIMARY KEY (id))',
+    'CREATE INDEX ix_bin_rule_next_occurrence ON bin_rule (next_occurrence)',
+    'CREATE TABLE schedule_exception (id INTEGER NOT NULL, original_date DATE NOT NULL, moved_to DATE, '
+    'PRIMARY KEY (id), UNIQUE (original_date))',
+    'CREATE TABLE assignment (id INTEGER NOT NULL, collection_date DATE NOT NULL, bin_type VARCHAR(80) NOT NULL, '
+    'bin_color VARCHAR(80) NOT NULL, resident_id INTEGER, resident_name VARCHAR(80) NOT NULL, confirmed_at DATETIME, '
+    'PRIMARY KEY (id), UNIQUE (collection_date), FOREIGN KEY(resident_id) REFERENCES resident (id) ON DELETE SET NULL)',
+    "INSERT INTO resident (id, name, position) VALUES (1, 'Ann', 1), (2, 'Bob', 2)",
+    "INSERT INTO app_state (id, last_position, version, next_collection_date) VALUES (1, 1, 7, '2026-10-23')",
+    "INSERT INTO bin_rule (id, bin_type, bin_color, anchor_date, interval_weeks, next_occurrence) "
+    "VALUES (1, 'General waste', 'grey', '2026-01-09', 1, '2026-10-23')",
+    "INSERT INTO schedule_exception (id, original_date, moved_to) VALUES (1, '2026-12-25', '2026-12-28')",
+    "INSERT INTO assignment (id, collection_date, bin_type, bin_color, resident_id, resident_name) "
+    "VALUES (1, '2026-10-23', 'General waste', 'grey', 2, 'Bob')",
+]
+
+def make_database(tmp_path, statements):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    with engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+    return engine
+
+def test_upgrade_baseline_schema(tmp_path, monkeypatch):
+    monkeypatch.setenv('WHATSAPP_GROUP_CHAT_ID', 'legacy@g.us')
+    engine = make_database(tmp_path, BASELINE_SCHEMA)
+    init_db(engine)
+    init_db(engine) # Safe to run on every deploy
+
+    with Session(engine) as db_session:
+        household = db_session.query(Household).one()
+        assert (household.name, household.chat_id) == ('Home', 'legacy@g.us')
+        residents = db_session.query(Resident).order_by(Resident.position).all()
+        assert [(r.name, r.position, r.household_id) for r in residents] == \
+            [('Ann', 1, household.id), ('Bob', 2, household.id), ('Cy', 3, household.id)]
+        state = db_session.query(AppState).one()
+        # The old index 1 pointed at Bob, the second resident by id
+        assert (state.household_id, state.last_position) == (household.id, 2)
+        assert db_session.query(BinRule).filter_by(household_id=household.id).count() == 2
+        assert state.next_collection_date is not None
+
+        # Names are unique per household now, not overall
+        other = Household(name='Flat 2')
+        db_session.add(other)
+        db_session.flush()
+        db_session.add(Resident(household_id=other.id, name='Ann', position=1))
+        db_session.commit()
+
+def test_upgrade_pre_household_schema(tmp_path):
+    engine = make_database(tmp_path, PRE_HOUSEHOLD_SCHEMA)
+    init_db(engine)
+
+    with Session(engine) as db_session:
+        household_id = db_session.query(Household.id).scalar()
+        assert db_session.query(AppState).one().version == 7
+        assert db_session.query(BinRule).filter_by(household_id=household_id).count() == 1 # Kept, not re-seeded
+        assignment = db_session.query(Assignment).one()
+        assert (assignment.household_id, assignment.resident_name) == (household_id, 'Bob')
+
+def test_upgraded_schema_matches_models(tmp_path):
+    engine = make_database(tmp_path, PRE_HOUSEHOLD_SCHEMA)
+    init_db(engine)
+    fresh = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    init_db(fresh)
+
+    for table in HOUSEHOLD_TABLES:
+        upgraded_inspector, fresh_inspector = inspect(engine), inspect(fresh)
+        column = next(c for c in upgraded_inspector.get_columns(table) if c['name'] == 'household_id')
+        assert not column['nullable'], table
+        assert upgraded_inspector.get_foreign_keys(table) == fresh_inspector.get_foreign_keys(table), table
+        assert sorted(index['name'] for index in upgraded_inspector.get_indexes(table)) == \
+            sorted(index['name'] for index in fresh_inspector.get_indexes(table)), table
@@ -0,0 +1,38 @@
+"""Per-phase timing spans for the reminder job, written as JSON log lines."""
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+# Set REMINDER_TIMING_LOG=0 to silence the span lines
+TIMING_LOG = os.getenv('REMINDER_TIMING_LOG', '1').lower() not in ('0', 'false', 'no')
+
+_listeners = []
+
+def add_listener(listener):
+    """Call listener(event) for every span, e.g. to collect them in a benchmark."""
+    _listeners.append(listener)
+
+def remove_listener(listener):
+    _listeners.remove(listener)
+
+def record(name, duration_ms, **fields):
+    event = {"event": "span", "span": name, "duration_ms": round(duration_ms, 3), **fields}
+    for listener in list(_listeners):
+        listener(event)
+    if TIMING_LOG:
+        print(json.dumps(event), file=sys.stderr, flush=True)
+
+@contextmanager
+def span(name, **fields):
+    """Time the enclosed block; the yielded dict can be filled with extra fields."""
+    start = time.perf_counter()
+    fields['status'] = 'ok'
+    try:
+        yield fields
+    except BaseException:
+        fields['status'] = 'error'
+        raise
+    finally:
+        record(name, (time.perf_counter() - start) * 1000, **fields)